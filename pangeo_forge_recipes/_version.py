@@ -0,0 +1 @@
+__version__ = '0.1.dev21+gee6d629d4.d20261014'
\ No newline at end of file
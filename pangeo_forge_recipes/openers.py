@@ -1,16 +1,176 @@
 """Standalone functions for opening sources as Dataset objects."""
 
+import copy
+import functools
+import importlib
+import importlib.metadata
+import inspect
 import io
+import json
+import logging
+import os
+import re
 import tempfile
+import threading
 import warnings
-from typing import Dict, Optional, Union
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Dict, Literal, Mapping, Optional, Set, Tuple, Union, cast
 from urllib.parse import urlparse
 
+import fsspec
+import numpy as np
 import xarray as xr
 import zarr
+from fsspec.implementations.local import LocalFileSystem
+from xarray.backends import BackendArray
+from xarray.backends.zarr import ZarrArrayWrapper, ZarrStore
+from xarray.core import indexing
 
 from .patterns import FileType
-from .storage import CacheFSSpecTarget, OpenFileType, _copy_btw_filesystems, _get_opener
+from .storage import (
+    CacheFSSpecTarget,
+    OpenFileType,
+    _add_query_string_secrets,
+    _copy_btw_filesystems_overlapped,
+    _get_opener,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# arguments of `fsspec.open` which configure the open file, rather than the filesystem
+_OPEN_FILE_KWARGS = tuple(
+    k for k in inspect.signature(fsspec.core.OpenFile).parameters if k not in ("fs", "path", "mode")
+)
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_fs(pid: int, thread_id: int, protocol: str, kw: Tuple) -> fsspec.AbstractFileSystem:
+    """Look up the fsspec filesystem for ``protocol`` and ``kw``.
+
+    ``fsspec.filesystem`` already caches instances per process and thread; memoizing here only
+    skips re-tokenizing ``kw`` for every url. Like fsspec's cache, this is keyed on ``pid`` and
+    ``thread_id``, so async filesystems are never used with another process's (or thread's)
+    event loop.
+    """
+    return fsspec.filesystem(protocol, **dict(kw))
+
+
+def _opener_from_cached_fs(url: str, secrets: Optional[Dict], **kw) -> OpenFileType:
+    url = url if not secrets else _add_query_string_secrets(url, secrets)
+    if "::" in url:
+        # chained urls are resolved by ``fsspec.open``
+        return _get_opener(url, None, **kw)
+    protocol = kw.get("protocol") or fsspec.core.split_protocol(url)[0] or "file"
+    # like ``fsspec.open``, options encoded in the url (e.g. s3 ``?versionId=``, or the account
+    # name in ``abfs://container@account...``) apply unless they are passed explicitly
+    fs_kw = fsspec.get_filesystem_class(protocol)._get_kwargs_from_urls(url)
+    fs_kw.update({k: v for k, v in kw.items() if k not in _OPEN_FILE_KWARGS + ("protocol",)})
+    open_file_kw = {k: v for k, v in kw.items() if k in _OPEN_FILE_KWARGS}
+    try:
+        key = tuple(sorted(fs_kw.items()))
+        fs = _cached_fs(os.getpid(), threading.get_ident(), protocol, key)
+    except TypeError:
+        # unhashable ``open_kwargs`` (e.g. nested dicts) can't be used as cache keys
+        return _get_opener(url, None, **kw)
+    return fsspec.core.OpenFile(fs, fs._strip_protocol(url), mode="rb", **open_file_kw)
+
+
+# created lazily, and again in each forked child: children inherit the executor's queue and
+# semaphore, but not its worker threads, so anything submitted to the parent's executor would
+# never run there
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+_prefetch_futures: "weakref.WeakValueDictionary[str, Future]" = weakref.WeakValueDictionary()
+_prefetch_lock = threading.Lock()
+
+
+def _reset_prefetch_executor() -> None:
+    global _prefetch_executor, _prefetch_futures, _prefetch_lock
+    _prefetch_executor = None
+    _prefetch_futures = weakref.WeakValueDictionary()
+    _prefetch_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_prefetch_executor)
+
+
+def _open_cached_file(cache: CacheFSSpecTarget, url: str) -> OpenFileType:
+    return cache.open_file(url, mode="rb")
+
+
+class PrefetchedOpenFile:
+    """An open-file-like handle for a url which is being copied into ``cache`` in the background.
+    Methods which need the data (``open``, entering the context manager, pickling) block until
+    the copy has finished.
+    """
+
+    def __init__(
+        self,
+        future: Future,
+        cache: CacheFSSpecTarget,
+        url: str,
+        secrets: Optional[Dict] = None,
+        open_kwargs: Optional[Dict] = None,
+    ):
+        self._future = future
+        self._pid = os.getpid()
+        self.cache = cache
+        self.url = url
+        self.secrets = secrets
+        self.open_kwargs = open_kwargs or {}
+        self._open_file: Optional[OpenFileType] = None
+
+    @property
+    def path(self) -> str:
+        return self.cache._full_path(self.url)
+
+    def _wait(self) -> None:
+        if self._pid != os.getpid() and not self._future.done():
+            # inherited through a fork from a process whose copy was still running; that copy
+            # will never finish in this process, so start another one here
+            self._future = _submit_prefetch(self.url, self.cache, self.secrets, **self.open_kwargs)
+            self._pid = os.getpid()
+        self._future.result()  # re-raises any error from `cache_file`
+
+    def open(self) -> OpenFileType:
+        self._wait()
+        return _open_cached_file(self.cache, self.url)
+
+    def __enter__(self):
+        self._open_file = self.open()
+        return self._open_file
+
+    def __exit__(self, *args):
+        if self._open_file is not None:
+            self._open_file.close()
+            self._open_file = None
+
+    def __reduce__(self):
+        self._wait()
+        return (_open_cached_file, (self.cache, self.url))
+
+
+def _submit_prefetch(url: str, cache: CacheFSSpecTarget, secrets: Optional[Dict], **kw) -> Future:
+    global _prefetch_executor
+    key = cache._full_path(url)
+    with _prefetch_lock:
+        future = _prefetch_futures.get(key)
+        if future is None:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix="pgf-prefetch"
+                )
+            future = _prefetch_executor.submit(cache.cache_file, url, secrets, **kw)
+            _prefetch_futures[key] = future
+    return future
+
+
+def _prefetch(url: str, cache: CacheFSSpecTarget, secrets: Optional[Dict], **kw):
+    future = _submit_prefetch(url, cache, secrets, **kw)
+    return PrefetchedOpenFile(future, cache, url, secrets, kw)
 
 
 def open_url(
@@ -18,24 +178,34 @@ def open_url(
     cache: Optional[CacheFSSpecTarget] = None,
     secrets: Optional[Dict] = None,
     open_kwargs: Optional[Dict] = None,
-) -> OpenFileType:
+    prefetch: bool = False,
+) -> Union[OpenFileType, PrefetchedOpenFile]:
     """Open a string-based URL with fsspec.
 
     :param url: The URL to be parsed by fsspec.
     :param cache: If provided, data will be cached in the object before opening.
     :param secrets: If provided these secrets will be injected into the URL as a query string.
     :param open_kwargs: Extra arguments passed to fsspec.open.
+    :param prefetch: If True, copy the url into ``cache`` on a background thread and return
+      immediately with a handle which blocks on first use. Requires ``cache``.
     """
     kw = open_kwargs or {}
+    if prefetch:
+        if cache is None:
+            raise ValueError("Prefetching requires a cache to download into.")
+        return _prefetch(url, cache, secrets, **kw)
     if cache is not None:
         # this has side effects
         cache.cache_file(url, secrets, **kw)
         open_file = cache.open_file(url, mode="rb")
     else:
-        open_file = _get_opener(url, secrets, **kw)
+        open_file = _opener_from_cached_fs(url, secrets, **kw)
     return open_file
 
 
+open_url.cache_clear = _cached_fs.cache_clear  # type: ignore[attr-defined]
+
+
 OPENER_MAP = {
     FileType.netcdf3: dict(engine="scipy"),
     FileType.netcdf4: dict(engine="h5netcdf"),
@@ -43,50 +213,204 @@ OPENER_MAP = {
     FileType.opendap: dict(engine="netcdf4"),
     FileType.grib: dict(engine="cfgrib"),
 }
+_ENGINE_OF = {file_type: kw["engine"] for file_type, kw in OPENER_MAP.items()}
+
+# Defaults applied to ``xarray_open_kwargs`` for Zarr inputs, unless explicitly set by the user.
+# ``chunks={}`` preserves the native Zarr chunking (lazily, via dask) instead of xarray's eager
+# loading, and ``consolidated=True`` avoids per-array metadata requests to cloud stores.
+ZARR_OPEN_DEFAULTS = dict(chunks={}, consolidated=True)
 
 
 def _set_engine(file_type, xr_open_kwargs):
-    kw = xr_open_kwargs.copy()
-    if file_type == FileType.unknown:
-        # Enable support for archives containing a mix of types e.g. netCDF3 and netCDF4 products
-        if "engine" not in kw:
-            warnings.warn(
-                "Unknown file type specified without xarray engine, "
-                "backend engine will be automatically selected by xarray"
-            )
-    elif "engine" in kw:
-        engine_message_base = (
-            "pangeo-forge-recipes will automatically set the xarray backend for "
-            f"files of type '{file_type.value}' to '{OPENER_MAP[file_type]}', "
-        )
-        warn_matching_msg = engine_message_base + (
+    try:
+        kw = dict(_set_engine_cached(file_type, frozenset(xr_open_kwargs.items())))
+    except TypeError:
+        # unhashable kwarg values (e.g. ``backend_kwargs`` dicts) can't be cached
+        kw = _set_engine_uncached(file_type, xr_open_kwargs)
+    if file_type == FileType.zarr:
+        # (deep) copied, so that callers never share the mutable ``chunks={}`` default
+        for k, v in copy.deepcopy(ZARR_OPEN_DEFAULTS).items():
+            kw.setdefault(k, v)
+    return kw
+
+
+@functools.lru_cache(maxsize=16)
+def _set_engine_cached(file_type, xr_open_kwargs_items: frozenset) -> Mapping:
+    return MappingProxyType(_set_engine_uncached(file_type, dict(xr_open_kwargs_items)))
+
+
+# (file_type, engine) pairs for which `_set_engine_uncached` has already warned
+_warned: Set[Tuple[FileType, Optional[str]]] = set()
+
+
+def _engine_message(file_type: FileType, engine: str, matching: bool) -> str:
+    message = (
+        "pangeo-forge-recipes will automatically set the xarray backend for "
+        f"files of type '{file_type.value}' to '{OPENER_MAP[file_type]}', "
+    )
+    if matching:
+        message += (
             "which is the same value you have passed via `xarray_open_kwargs`. "
             f"If this input file is actually of type '{file_type.value}', you can "
-            f"remove `{{'engine': '{kw['engine']}'}}` from `xarray_open_kwargs`. "
+            f"remove `{{'engine': '{engine}'}}` from `xarray_open_kwargs`. "
         )
-        error_mismatched_msg = engine_message_base + (
+    else:
+        message += (
             f"which is different from the value you have passed via "
             "`xarray_open_kwargs`. If this input file is actually of type "
-            f"'{file_type.value}', please remove `{{'engine': '{kw['engine']}'}}` "
+            f"'{file_type.value}', please remove `{{'engine': '{engine}'}}` "
             "from `xarray_open_kwargs`. "
         )
-        engine_message_tail = (
-            f"If this input file is not of type '{file_type.value}', please update"
-            " this recipe by passing a different value to `FilePattern.file_type`."
-        )
-        warn_matching_msg += engine_message_tail
-        error_mismatched_msg += engine_message_tail
+    return message + (
+        f"If this input file is not of type '{file_type.value}', please update"
+        " this recipe by passing a different value to `FilePattern.file_type`."
+    )
+
 
-        if kw["engine"] == OPENER_MAP[file_type]["engine"]:
-            warnings.warn(warn_matching_msg)
-        elif kw["engine"] != OPENER_MAP[file_type]["engine"]:
-            raise ValueError(error_mismatched_msg)
+def _set_engine_uncached(file_type, xr_open_kwargs):
+    kw = xr_open_kwargs.copy()
+    if file_type == FileType.unknown:
+        # Enable support for archives containing a mix of types e.g. netCDF3 and netCDF4 products
+        if "engine" not in kw and (file_type, None) not in _warned:
+            _warned.add((file_type, None))
+            warnings.warn(
+                "Unknown file type specified without xarray engine, "
+                "backend engine will be automatically selected by xarray"
+            )
+    elif "engine" in kw:
+        engine = kw["engine"]
+        if engine != _ENGINE_OF[file_type]:
+            raise ValueError(_engine_message(file_type, engine, matching=False))
+        if (file_type, engine) not in _warned:
+            _warned.add((file_type, engine))
+            warnings.warn(_engine_message(file_type, engine, matching=True))
     else:
         kw.update(OPENER_MAP[file_type])
     return kw
 
 
-UrlOrFileObj = Union[OpenFileType, str, zarr.storage.FSStore]
+# the key zarr stores consolidated metadata under; only failures to read it are retried
+_CONSOLIDATED_METADATA_KEY = ".zmetadata"
+
+
+def _open_dataset(url_or_file_obj, kw: dict, injected_defaults: set) -> xr.Dataset:
+    """``xr.open_dataset``, retrying if any defaults we've injected can't be honored."""
+    try:
+        return xr.open_dataset(url_or_file_obj, **kw)
+    except NotImplementedError:
+        # object dtypes can't be opened with dask chunks
+        if "chunks" not in injected_defaults:
+            raise
+        kw = {k: v for k, v in kw.items() if k != "chunks"}
+        return _open_dataset(url_or_file_obj, kw, injected_defaults - {"chunks"})
+    except (KeyError, FileNotFoundError) as e:
+        # not all stores are consolidated. retry with ``consolidated=False`` rather than xarray's
+        # default (``None``), which would look for consolidated metadata again, then warn
+        if "consolidated" not in injected_defaults or _CONSOLIDATED_METADATA_KEY not in str(e):
+            raise
+        kw = {**kw, "consolidated": False}
+        return _open_dataset(url_or_file_obj, kw, injected_defaults - {"consolidated"})
+
+
+_MAGIC_NUMBERS = (
+    (b"\x89HDF", FileType.netcdf4),
+    (b"CDF\x01", FileType.netcdf3),
+    (b"CDF\x02", FileType.netcdf3),
+    # CDF-5 (``CDF\x05``) is left unknown: scipy can't read it, but xarray's own engine
+    # selection can (via netCDF4)
+    (b"GRIB", FileType.grib),
+)
+_ZARR_MARKERS = (".zgroup", ".zarray", "zarr.json")
+
+
+def _file_type_from_header(header: bytes) -> FileType:
+    for magic, file_type in _MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return file_type
+    return FileType.unknown
+
+
+def _sniff_header_and_zarr(fs: fsspec.AbstractFileSystem, path: str) -> FileType:
+    try:
+        # a single ranged read; ``fs.open`` would fetch a whole (default-sized) block
+        file_type = _file_type_from_header(fs.cat_file(path, start=0, end=8))
+    except (IsADirectoryError, FileNotFoundError, PermissionError):
+        file_type = FileType.unknown
+    if file_type == FileType.unknown:
+        root = path.rstrip("/")
+        if any(fs.exists(f"{root}/{marker}") for marker in _ZARR_MARKERS):
+            file_type = FileType.zarr
+    return file_type
+
+
+@functools.lru_cache(maxsize=4096)
+def _sniff_url_file_type(url: str, storage_options: Tuple) -> FileType:
+    fs, path = fsspec.core.url_to_fs(url, **dict(storage_options))
+    return _sniff_header_and_zarr(fs, path)
+
+
+def _sniff_file_type(url_or_file_obj, storage_options: Optional[Dict] = None) -> FileType:
+    """Detect the type of ``url_or_file_obj`` from its magic number (or Zarr metadata files),
+    reading only its first few bytes. Returns ``FileType.unknown`` if detection fails.
+
+    :param url_or_file_obj: The url or file object to be sniffed.
+    :param storage_options: Passed to fsspec when ``url_or_file_obj`` is a string url.
+    """
+    try:
+        if isinstance(url_or_file_obj, str):
+            storage_options = storage_options or {}
+            try:
+                key = tuple(sorted(storage_options.items()))
+                return _sniff_url_file_type(url_or_file_obj, key)
+            except TypeError:
+                # unhashable storage options can't be used as cache keys
+                fs, path = fsspec.core.url_to_fs(url_or_file_obj, **storage_options)
+                return _sniff_header_and_zarr(fs, path)
+        elif isinstance(url_or_file_obj, zarr.storage.FSStore):
+            return FileType.zarr
+        elif getattr(url_or_file_obj, "read", None) and getattr(url_or_file_obj, "seek", None):
+            pos = url_or_file_obj.tell()
+            url_or_file_obj.seek(0)
+            header = url_or_file_obj.read(8)
+            url_or_file_obj.seek(pos)
+            return _file_type_from_header(header)
+        elif isinstance(url_or_file_obj, fsspec.core.OpenFile) and not url_or_file_obj.compression:
+            # read through the (already configured) filesystem, without opening the file
+            return _sniff_header_and_zarr(url_or_file_obj.fs, url_or_file_obj.path)
+        elif getattr(url_or_file_obj, "__enter__", None):
+            # NOTE: this opens the file an extra time (e.g. to decompress its first bytes), in
+            # addition to the open performed when it is later passed to xarray
+            with url_or_file_obj as f:
+                return _file_type_from_header(f.read(8))
+    except Exception as e:
+        logger.debug(f"Could not detect file type of {url_or_file_obj}: {e!r}")
+    return FileType.unknown
+
+
+UrlOrFileObj = Union[OpenFileType, PrefetchedOpenFile, str, zarr.storage.FSStore]
+
+
+@functools.singledispatch
+def _normalize_source(url_or_file_obj) -> Tuple[UrlOrFileObj, bool]:
+    """Return ``url_or_file_obj`` in a form which can be passed to an opener, along with whether
+    or not it is a Zarr store.
+    """
+    open_ = getattr(url_or_file_obj, "open", None)
+    if open_ is not None:
+        # work around fsspec inconsistencies
+        return open_(), False
+    return url_or_file_obj, False
+
+
+@_normalize_source.register(str)
+@_normalize_source.register(io.IOBase)  # LocalFileOpener is a subclass of io.IOBase
+def _(url_or_file_obj) -> Tuple[UrlOrFileObj, bool]:
+    return url_or_file_obj, False
+
+
+@_normalize_source.register(zarr.storage.FSStore)
+def _(url_or_file_obj) -> Tuple[UrlOrFileObj, bool]:
+    return url_or_file_obj, True
 
 
 def _preprocess_url_or_file_obj(
@@ -95,24 +419,23 @@ def _preprocess_url_or_file_obj(
 ) -> UrlOrFileObj:
     """Validate and preprocess inputs for opener functions."""
 
-    if isinstance(url_or_file_obj, str):
-        pass
-    elif isinstance(url_or_file_obj, zarr.storage.FSStore):
-        if file_type is not FileType.zarr:
-            raise ValueError(f"FSStore object can only be opened as FileType.zarr; got {file_type}")
-    elif isinstance(url_or_file_obj, io.IOBase):
-        # required to make mypy happy
-        # LocalFileOpener is a subclass of io.IOBase
-        pass
-    elif hasattr(url_or_file_obj, "open"):
-        # work around fsspec inconsistencies
-        url_or_file_obj = url_or_file_obj.open()
-
+    url_or_file_obj, is_store = _normalize_source(url_or_file_obj)
+    if is_store and file_type is not FileType.zarr:
+        raise ValueError(f"FSStore object can only be opened as FileType.zarr; got {file_type}")
     return url_or_file_obj
 
 
+def _local_path_or_none(url_or_file_obj: UrlOrFileObj) -> Optional[str]:
+    """Return the path of ``url_or_file_obj`` if it is an uncompressed, local fsspec file."""
+    fs = getattr(url_or_file_obj, "fs", None)
+    if not isinstance(fs, LocalFileSystem) or getattr(url_or_file_obj, "compression", None):
+        return None
+    path = getattr(url_or_file_obj, "path", None)
+    return path if isinstance(path, str) and os.path.isfile(path) else None
+
+
 def _url_as_str(url_or_file_obj: UrlOrFileObj, remote_protocol: Optional[str] = None) -> str:
-    as_str: str = url_or_file_obj.path if hasattr(url_or_file_obj, "path") else url_or_file_obj
+    as_str = cast(str, getattr(url_or_file_obj, "path", url_or_file_obj))
 
     if remote_protocol and not urlparse(as_str).scheme:
         # `.full_path` attributes (which include scheme/protocol) are not present on all
@@ -128,6 +451,56 @@ def _url_as_str(url_or_file_obj: UrlOrFileObj, remote_protocol: Optional[str] =
     return as_str
 
 
+_KERCHUNK_READERS = {
+    FileType.netcdf4: ("kerchunk.hdf", "SingleHdf5ToZarr"),
+    FileType.netcdf3: ("kerchunk.netCDF3", "NetCDF3ToZarr"),
+    FileType.grib: ("kerchunk.grib2", "scan_grib"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_kerchunk_reader(file_type: FileType):
+    """Import (once per process) and return the kerchunk reader for ``file_type``."""
+    module_name, attr = _KERCHUNK_READERS[file_type]
+    return getattr(importlib.import_module(module_name), attr)
+
+
+# the first kerchunk release whose ``SingleHdf5ToZarr`` uses ``DatasetID.chunk_iter``
+_KERCHUNK_CHUNK_ITER_VERSION = (0, 1, 2)
+
+
+def _kerchunk_version() -> Tuple[int, ...]:
+    version = importlib.metadata.version("kerchunk")
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+@functools.lru_cache(maxsize=None)
+def _check_hdf5_chunk_iter() -> bool:
+    """Warn (once per process) if kerchunk can't enumerate HDF5 chunks with ``chunk_iter``.
+
+    ``SingleHdf5ToZarr`` (as of kerchunk 0.1.2) uses ``DatasetID.chunk_iter`` when it is
+    available (h5py >= 3.8 built against HDF5 >= 1.12.3); otherwise, or with older kerchunk
+    releases, it makes one ``get_chunk_info`` call per chunk, which can be orders of magnitude
+    slower for datasets with many chunks.
+    """
+    import h5py
+
+    if _kerchunk_version() < _KERCHUNK_CHUNK_ITER_VERSION:
+        warnings.warn(
+            "The installed kerchunk enumerates HDF5 chunks one at a time, which is slow for "
+            "inputs with many chunks. Consider upgrading to kerchunk >= 0.1.2."
+        )
+        return False
+    has_chunk_iter = callable(getattr(h5py.h5d.DatasetID, "chunk_iter", None))
+    if not has_chunk_iter:
+        warnings.warn(
+            "The installed h5py does not support `DatasetID.chunk_iter`, so kerchunk will "
+            "enumerate HDF5 chunks one at a time, which is slow for inputs with many chunks. "
+            "Consider upgrading to h5py >= 3.8 built against HDF5 >= 1.12.3."
+        )
+    return has_chunk_iter
+
+
 def open_with_kerchunk(
     url_or_file_obj: UrlOrFileObj,
     file_type: FileType = FileType.unknown,
@@ -160,8 +533,8 @@ def open_with_kerchunk(
     url_as_str = _url_as_str(url_or_file_obj, remote_protocol)
 
     if file_type == FileType.netcdf4:
-        from kerchunk.hdf import SingleHdf5ToZarr
-
+        SingleHdf5ToZarr = _get_kerchunk_reader(file_type)
+        _check_hdf5_chunk_iter()
         h5chunks = SingleHdf5ToZarr(
             url_or_file_obj,
             url=url_as_str,
@@ -172,8 +545,7 @@ def open_with_kerchunk(
         refs = [h5chunks.translate()]
 
     elif file_type == FileType.netcdf3:
-        from kerchunk.netCDF3 import NetCDF3ToZarr
-
+        NetCDF3ToZarr = _get_kerchunk_reader(file_type)
         chunks = NetCDF3ToZarr(
             url_as_str,
             inline_threshold=inline_threshold,
@@ -183,8 +555,7 @@ def open_with_kerchunk(
         refs = [chunks.translate()]
 
     elif file_type == FileType.grib:
-        from kerchunk.grib2 import scan_grib
-
+        scan_grib = _get_kerchunk_reader(file_type)
         refs = scan_grib(
             url=url_as_str,
             inline_threshold=inline_threshold,
@@ -198,12 +569,228 @@ def open_with_kerchunk(
     return refs
 
 
+# Older versions of xarray's ``ZarrArrayWrapper`` store ``(variable_name, datastore)`` and
+# look the array up in ``datastore.zarr_group`` (re-reading its metadata) on every chunk read.
+_ZARR_WRAPPER_REOPENS_ARRAY = "variable_name" in inspect.signature(ZarrArrayWrapper).parameters
+
+
+class _ArrayCachingGroup:
+    """Proxy for a ``zarr.Group`` which opens each of its arrays at most once."""
+
+    def __init__(self, group: zarr.Group):
+        self._group = group
+        self._arrays: Dict[str, zarr.Array] = {}
+
+    def __getitem__(self, key: str):
+        if key not in self._arrays:
+            self._arrays[key] = self._group[key]
+        return self._arrays[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._group
+
+    def __iter__(self):
+        return iter(self._group)
+
+    def __getattr__(self, name: str):
+        # dunder lookups (e.g. ``__setstate__`` while unpickling) must not recurse into ``_group``
+        if name.startswith("__") or name in ("_group", "_arrays"):
+            raise AttributeError(name)
+        return getattr(self._group, name)
+
+
+def _share_zarr_array_handles(ds: xr.Dataset) -> None:
+    """Make the lazy (or dask-backed) variables of a Zarr-backed ``ds`` share one array handle
+    per variable, instead of reopening the array from its group on every chunk read.
+    """
+    store = getattr(getattr(ds, "_close", None), "__self__", None)
+    if isinstance(store, ZarrStore) and not isinstance(store.zarr_group, _ArrayCachingGroup):
+        store.zarr_group = _ArrayCachingGroup(store.zarr_group)
+
+
+@functools.lru_cache(maxsize=256)
+def _open_tensorstore(pid: int, spec_json: str):
+    """Open (once per process and unique ``spec_json``) a tensorstore handle, so that arrays
+    unpickled for every dask task don't each re-read their ``.zarray`` metadata.
+    """
+    import tensorstore as ts
+
+    return ts.open(json.loads(spec_json), read=True).result()
+
+
+class _TensorStoreArray(BackendArray):
+    """Lazily indexed xarray backend array for a single Zarr array, read with tensorstore."""
+
+    def __init__(self, spec: dict, shape: Tuple[int, ...], dtype: np.dtype):
+        self.spec = spec
+        self.shape = shape
+        self.dtype = dtype
+        self._array = None
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = _open_tensorstore(os.getpid(), json.dumps(self.spec, sort_keys=True))
+        return self._array
+
+    def __getstate__(self):
+        # tensorstore handles are reopened from ``spec`` after unpickling
+        return {**self.__dict__, "_array": None}
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.OUTER, self._getitem
+        )
+
+    def _getitem(self, key):
+        return self.array.oindex[key].read().result()
+
+
+def _tensorstore_kvstore(url: str, storage_options: Optional[Dict] = None) -> dict:
+    """Translate an fsspec-style url and its ``storage_options`` into a tensorstore key-value
+    store spec. Raises ``ValueError`` for urls or options which the spec can't express.
+    """
+    parsed = urlparse(url)
+    if parsed.query or parsed.fragment:
+        raise ValueError("Urls with query strings are not supported by the tensorstore backend.")
+    options = dict(storage_options or {})
+    client_kwargs = dict(options.pop("client_kwargs", None) or {})
+    path = parsed.path.rstrip("/") + "/"
+    if parsed.scheme in ("", "file", "local"):
+        kvstore: dict = {"driver": "file", "path": path}
+        options.pop("auto_mkdir", None)  # set by zarr's ``FSStore``; irrelevant for reads
+    elif parsed.scheme in ("gs", "gcs"):
+        kvstore = {"driver": "gcs", "bucket": parsed.netloc, "path": path.lstrip("/")}
+    elif parsed.scheme == "s3":
+        kvstore = {"driver": "s3", "bucket": parsed.netloc, "path": path.lstrip("/")}
+        if not options.get("anon", True):
+            del options["anon"]  # ``anon=False`` is the default credentials chain
+        endpoint = options.pop("endpoint_url", None) or client_kwargs.pop("endpoint_url", None)
+        if endpoint:
+            kvstore["endpoint"] = endpoint
+        region = client_kwargs.pop("region_name", None)
+        if region:
+            kvstore["aws_region"] = region
+        if options.pop("requester_pays", False):
+            kvstore["requester_pays"] = True
+    elif parsed.scheme in ("http", "https"):
+        kvstore = {"driver": "http", "base_url": f"{parsed.scheme}://{parsed.netloc}", "path": path}
+        headers = {**client_kwargs.pop("headers", {}), **options.pop("headers", {})}
+        for kw in (options, client_kwargs):
+            if hasattr(kw.get("auth"), "encode"):
+                # e.g. ``aiohttp.BasicAuth``
+                headers["Authorization"] = kw.pop("auth").encode()
+        if headers:
+            kvstore["headers"] = [f"{k}: {v}" for k, v in headers.items()]
+    else:
+        raise ValueError(f"Protocol '{parsed.scheme}' is not supported by the tensorstore backend.")
+    unsupported = sorted(options) + sorted(f"client_kwargs.{k}" for k in client_kwargs)
+    if unsupported:
+        raise ValueError(
+            f"Storage options {unsupported} can't be passed to tensorstore's "
+            f"'{kvstore['driver']}' key-value store; use `zarr_backend='zarr'` instead."
+        )
+    return kvstore
+
+
+_DECODE_CF_KWARGS = (
+    "mask_and_scale",
+    "decode_times",
+    "concat_characters",
+    "decode_coords",
+    "drop_variables",
+    "use_cftime",
+    "decode_timedelta",
+)
+
+
+def _open_zarr_with_tensorstore(
+    url_or_file_obj: Union[str, zarr.storage.FSStore],
+    xarray_open_kwargs: Dict,
+    injected_defaults: set,
+) -> xr.Dataset:
+    """Open a Zarr store as an xarray Dataset whose variables are read with tensorstore.
+
+    Metadata is read once with zarr (from consolidated metadata unless ``consolidated=False``),
+    through fsspec with the ``storage_options`` in ``xarray_open_kwargs`` (or its
+    ``backend_kwargs``). The undecoded variables are then CF-decoded by xarray, which honors the
+    decoding options (e.g. ``decode_cf``, ``decode_times``) in ``xarray_open_kwargs``. As with
+    xarray's zarr engine, ``chunks`` selects dask-backed variables (``{}`` for the native zarr
+    chunks), and ``chunks=None`` lazily indexed ones.
+    """
+    backend_kwargs = xarray_open_kwargs.get("backend_kwargs") or {}
+    storage_options = xarray_open_kwargs.get(
+        "storage_options", backend_kwargs.get("storage_options")
+    )
+    consolidated = xarray_open_kwargs.get("consolidated", backend_kwargs.get("consolidated"))
+    if isinstance(url_or_file_obj, zarr.storage.FSStore):
+        store = url_or_file_obj
+        url = store.fs.unstrip_protocol(store.path)
+        storage_options = store.fs.storage_options
+    else:
+        url = url_or_file_obj
+        store = fsspec.get_mapper(url, **(storage_options or {}))
+    # raise before reading any metadata, if tensorstore can't honor the storage options
+    kvstore = _tensorstore_kvstore(url, storage_options)
+    drop_variables = set(xarray_open_kwargs.get("drop_variables") or [])
+
+    if consolidated is False:
+        group = zarr.open_group(store, mode="r")
+    else:
+        try:
+            group = zarr.open_consolidated(store, mode="r")
+        except KeyError as e:
+            # as for xarray's zarr engine, fall back to the per-array metadata files
+            explicit = consolidated and "consolidated" not in injected_defaults
+            if explicit or _CONSOLIDATED_METADATA_KEY not in str(e):
+                raise
+            group = zarr.open_group(store, mode="r")
+    variables = {}
+    for name, zarray in group.arrays():
+        if name in drop_variables:
+            continue
+        attrs = dict(zarray.attrs)
+        dims = attrs.pop("_ARRAY_DIMENSIONS")
+        if zarray.fill_value is not None:
+            attrs["_FillValue"] = zarray.fill_value
+        spec = {
+            "driver": "zarr",
+            "kvstore": {**kvstore, "path": f"{kvstore['path']}{name}/"},
+        }
+        array = _TensorStoreArray(spec, zarray.shape, zarray.dtype)
+        encoding = {"chunks": zarray.chunks, "compressor": zarray.compressor}
+        variables[name] = xr.Variable(
+            dims, indexing.LazilyIndexedArray(array), attrs=attrs, encoding=encoding
+        )
+
+    ds = xr.Dataset(variables, attrs=dict(group.attrs))
+    if xarray_open_kwargs.get("decode_cf", True):
+        decode_kw = {k: v for k, v in xarray_open_kwargs.items() if k in _DECODE_CF_KWARGS}
+        decode_kw.pop("drop_variables", None)
+        ds = xr.decode_cf(ds, **decode_kw)
+
+    chunks = xarray_open_kwargs.get("chunks")
+    if chunks == {}:
+        # as for xarray's zarr engine, ``chunks={}`` means dask chunks matching the zarr chunks
+        chunked = {
+            name: var.chunk(dict(zip(var.dims, var.encoding["chunks"])))
+            if name not in ds.indexes
+            else var
+            for name, var in ds.variables.items()
+        }
+        ds = xr.Dataset(chunked, attrs=ds.attrs).set_coords(list(ds.coords))
+    elif chunks is not None:
+        ds = ds.chunk(chunks)
+    return ds
+
+
 def open_with_xarray(
     url_or_file_obj: Union[OpenFileType, str, zarr.storage.FSStore],
     file_type: FileType = FileType.unknown,
     load: bool = False,
     copy_to_local=False,
     xarray_open_kwargs: Optional[Dict] = None,
+    zarr_backend: Literal["zarr", "tensorstore"] = "zarr",
 ) -> xr.Dataset:
     """Open item with Xarray. Accepts either fsspec open-file-like objects
     or string URLs that can be passed directly to Xarray.
@@ -213,13 +800,39 @@ def open_with_xarray(
     :param load: Whether to eagerly load the data into memory ofter opening.
     :param copy_to_local: Whether to copy the file-like-object to a local path
        and pass the path to Xarray. Required for some file types (e.g. Grib).
-       Can only be used with file-like-objects, not URLs.
+       Can only be used with file-like-objects, not URLs. Usually not needed for netCDF4
+       inputs, which h5netcdf reads directly from seekable file-like-objects.
     :xarray_open_kwargs: Extra arguments to pass to Xarray's open function.
+    :param zarr_backend: Library used to read arrays from Zarr inputs; either ``"zarr"``
+       (Xarray's default Zarr engine) or ``"tensorstore"``. The latter requires the optional
+       ``tensorstore`` dependency and falls back to ``"zarr"`` (with a warning) if it is missing.
+       It raises ``ValueError`` for protocols or ``storage_options`` which can't be translated
+       into a tensorstore key-value store spec (e.g. inline s3 credentials).
     """
     # TODO: check file type matrix
 
-    kw = xarray_open_kwargs or {}
-    kw = _set_engine(file_type, kw)
+    user_kw = xarray_open_kwargs or {}
+    if file_type == FileType.unknown and "engine" not in user_kw:
+        # sniffing reads a few bytes, rather than xarray trying to open with each engine in turn
+        storage_options = user_kw.get("storage_options") or (
+            user_kw.get("backend_kwargs") or {}
+        ).get("storage_options")
+        file_type = _sniff_file_type(url_or_file_obj, storage_options)
+    kw = _set_engine(file_type, user_kw)
+    injected_defaults = set()
+    if file_type == FileType.zarr:
+        injected_defaults = set(ZARR_OPEN_DEFAULTS) - set(user_kw)
+    if zarr_backend == "tensorstore" and file_type == FileType.zarr:
+        try:
+            import tensorstore  # noqa: F401
+        except ImportError:
+            warnings.warn("`tensorstore` is not installed; falling back to `zarr_backend='zarr'`.")
+        else:
+            url_or_file_obj = _preprocess_url_or_file_obj(url_or_file_obj, file_type)
+            ds = _open_zarr_with_tensorstore(url_or_file_obj, kw, injected_defaults)
+            if load:
+                ds.load()
+            return ds
     if copy_to_local:
         if file_type in [FileType.zarr or FileType.opendap]:
             raise ValueError(f"File type {file_type} can't be copied to a local file.")
@@ -227,17 +840,31 @@ def open_with_xarray(
             raise ValueError(
                 "Won't copy string URLs to local files. Please call ``open_url`` first."
             )
-        ntf = tempfile.NamedTemporaryFile()
-        tmp_name = ntf.name
-        target_opener = open(tmp_name, mode="wb")
-        _copy_btw_filesystems(url_or_file_obj, target_opener)
+        # write through the fd returned by `mkstemp` rather than re-opening the path
+        fd, tmp_name = tempfile.mkstemp()
+        try:
+            _copy_btw_filesystems_overlapped(url_or_file_obj, os.fdopen(fd, mode="wb"))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
         url_or_file_obj = tmp_name
+    elif file_type in (FileType.netcdf3, FileType.netcdf4):
+        # let the backend read local files natively (mmap for scipy, the HDF5 C driver for
+        # h5netcdf), rather than through a python file object which copies every read
+        url_or_file_obj = _local_path_or_none(url_or_file_obj) or url_or_file_obj
 
     url_or_file_obj = _preprocess_url_or_file_obj(url_or_file_obj, file_type)
 
-    ds = xr.open_dataset(url_or_file_obj, **kw)
-    if load:
-        ds.load()
+    try:
+        ds = _open_dataset(url_or_file_obj, kw, injected_defaults)
+        if file_type == FileType.zarr and _ZARR_WRAPPER_REOPENS_ARRAY:
+            _share_zarr_array_handles(ds)
+        if load:
+            ds.load()
+    finally:
+        if copy_to_local:
+            # files already opened by the backend remain readable until they are closed
+            os.unlink(tmp_name)
 
     if copy_to_local and not load:
         warnings.warn(
@@ -4,7 +4,9 @@ import hashlib
 import io
 import logging
 import os
+import queue
 import re
+import threading
 import time
 import unicodedata
 from abc import ABC, abstractmethod
@@ -14,7 +16,7 @@ from typing import Iterator, Optional, Union
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
 import fsspec
-from fsspec.implementations.local import LocalFileSystem
+from fsspec.implementations.local import LocalFileOpener, LocalFileSystem
 from zarr.storage import FSStore
 
 logger = logging.getLogger(__name__)
@@ -51,6 +53,92 @@ def _copy_btw_filesystems(input_opener, output_opener, BLOCK_SIZE=10_000_000):
     logger.debug("_copy_btw_filesystems done")
 
 
+def _is_plain_file(f) -> bool:
+    """Whether reads and writes on ``f`` map directly onto its ``fileno()``. Decompressing
+    wrappers (e.g. ``gzip.GzipFile``) also expose the descriptor of the raw file they wrap.
+    """
+    if isinstance(f, LocalFileOpener):
+        return not f.compression
+    return isinstance(f, (io.FileIO, io.BufferedReader, io.BufferedWriter, io.BufferedRandom))
+
+
+def _copy_with_sendfile(source, target, BLOCK_SIZE=1 << 30) -> bool:
+    """Copy ``source`` into ``target`` in-kernel with ``os.sendfile``, if both are plain files
+    backed by operating system file descriptors. Returns ``False``, having copied nothing,
+    otherwise.
+    """
+    if not hasattr(os, "sendfile") or not (_is_plain_file(source) and _is_plain_file(target)):
+        return False
+    try:
+        in_fd, out_fd = source.fileno(), target.fileno()
+        offset = source.tell()
+        size = os.fstat(in_fd).st_size
+        target.flush()
+        # some platforms only support sending to sockets; find out before copying anything
+        sent = os.sendfile(out_fd, in_fd, offset, min(size - offset, BLOCK_SIZE))
+    except (AttributeError, OSError):  # includes io.UnsupportedOperation
+        return False
+    while sent:
+        offset += sent
+        sent = os.sendfile(out_fd, in_fd, offset, min(size - offset, BLOCK_SIZE))
+    logger.debug(f"_copy_with_sendfile done, total bytes copied: {offset}")
+    return True
+
+
+def _copy_btw_filesystems_overlapped(
+    input_opener, output_opener, BLOCK_SIZE=1 << 20, max_pending_blocks=8
+):
+    """Like ``_copy_btw_filesystems``, but reads from ``input_opener`` on a worker thread, so
+    that (typically network-bound) reads overlap with local writes. At most
+    ``max_pending_blocks`` blocks are buffered in memory at any time. Local sources are
+    copied with ``os.sendfile`` instead, where supported.
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=max_pending_blocks)
+    done = threading.Event()
+    errors: list = []
+
+    def _put(item) -> bool:
+        while not done.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(source):
+        try:
+            while True:
+                data = source.read(BLOCK_SIZE)
+                if not data or not _put(data):
+                    break
+        except BaseException as e:  # re-raised on the calling thread
+            errors.append(e)
+        finally:
+            _put(None)
+
+    with input_opener as source:
+        with output_opener as target:
+            if _copy_with_sendfile(source, target):
+                return
+            reader = threading.Thread(target=_read, args=(source,), daemon=True)
+            reader.start()
+            bytes_read = 0
+            try:
+                while True:
+                    data = blocks.get()
+                    if data is None:
+                        break
+                    target.write(data)
+                    bytes_read += len(data)
+            finally:
+                done.set()
+                reader.join()
+            if errors:
+                raise errors[0]
+    logger.debug(f"_copy_btw_filesystems_overlapped done, total bytes copied: {bytes_read}")
+
+
 class AbstractTarget(ABC):
     @abstractmethod
     def get_mapper(self):
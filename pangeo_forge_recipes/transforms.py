@@ -4,7 +4,18 @@ import logging
 import random
 import sys
 from dataclasses import dataclass, field
-from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 # PEP612 Concatenate & ParamSpec are useful for annotating decorators, but their import
 # differs between Python versions 3.9 & 3.10. See: https://stackoverflow.com/a/71990006
@@ -251,14 +262,18 @@ class OpenWithXarray(beam.PTransform):
     :param load: Whether to eagerly load the data into memory ofter opening.
     :param copy_to_local: Whether to copy the file-like-object to a local path
        and pass the path to Xarray. Required for some file types (e.g. Grib).
-       Can only be used with file-like-objects, not URLs.
+       Can only be used with file-like-objects, not URLs. Usually not needed for netCDF4
+       inputs, which h5netcdf reads directly from seekable file-like-objects.
     :param xarray_open_kwargs: Extra arguments to pass to Xarray's open function.
+    :param zarr_backend: Library used to read arrays from Zarr inputs; either ``"zarr"``
+       or ``"tensorstore"``. See :func:`pangeo_forge_recipes.openers.open_with_xarray`.
     """
 
     file_type: FileType = FileType.unknown
     load: bool = False
     copy_to_local: bool = False
     xarray_open_kwargs: Optional[dict] = field(default_factory=dict)
+    zarr_backend: Literal["zarr", "tensorstore"] = "zarr"
 
     def expand(self, pcoll):
         return pcoll | "Open with Xarray" >> beam.Map(
@@ -267,6 +282,7 @@ class OpenWithXarray(beam.PTransform):
             load=self.load,
             copy_to_local=self.copy_to_local,
             xarray_open_kwargs=self.xarray_open_kwargs,
+            zarr_backend=self.zarr_backend,
         )
 
 
@@ -1,13 +1,33 @@
+import gzip
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import Future
 from pickle import dumps, loads
 
+import aiohttp
+import fsspec
 import numpy as np
 import pytest
 import xarray as xr
+import zarr
 from apache_beam.testing.util import assert_that
+from fsspec.implementations.http import HTTPFileSystem
 from pytest_lazyfixture import lazy_fixture
 
-from pangeo_forge_recipes.openers import open_url, open_with_xarray
+from pangeo_forge_recipes import openers
+from pangeo_forge_recipes.openers import (
+    _ArrayCachingGroup,
+    _local_path_or_none,
+    _set_engine,
+    _sniff_file_type,
+    _tensorstore_kvstore,
+    open_url,
+    open_with_xarray,
+)
 from pangeo_forge_recipes.patterns import FileType
+from pangeo_forge_recipes.storage import _add_query_string_secrets
 from pangeo_forge_recipes.transforms import OpenWithKerchunk
 
 
@@ -71,6 +91,75 @@ def test_open_url(url_and_type, cache):
         assert data3 == data
 
 
+def test_open_url_prefetch(url_and_type, tmp_cache):
+    url, kwargs, _ = url_and_type
+    open_file = open_url(url, cache=tmp_cache, prefetch=True, **kwargs)
+    assert open_url(url, cache=tmp_cache, prefetch=True, **kwargs)._future is open_file._future
+    with open_file as f1:
+        data = f1.read()
+    assert tmp_cache.exists(url)
+    with loads(dumps(open_file)) as f2:
+        assert f2.read() == data
+    with pytest.raises(ValueError, match="requires a cache"):
+        open_url(url, prefetch=True, **kwargs)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_open_url_prefetch_after_fork(netcdf_local_paths_sequential_1d, tmp_cache):
+    url, other_url = netcdf_local_paths_sequential_1d[0][:2]
+    with open_url(url, cache=tmp_cache, prefetch=True):
+        pass  # the parent's executor now has a (soon idle) worker thread
+    # a handle for a copy which is still running when the process forks
+    pending = openers.PrefetchedOpenFile(Future(), tmp_cache, other_url)
+
+    def child():
+        with open_url(url, cache=tmp_cache, prefetch=True) as f:
+            f.read()
+        with pending as f:
+            f.read()
+        loads(dumps(pending))
+
+    process = multiprocessing.get_context("fork").Process(target=child)
+    process.start()
+    process.join(timeout=20)
+    if process.is_alive():
+        process.kill()
+    assert process.exitcode == 0
+    assert not pending._future.done()  # the parent's future is untouched
+
+
+def test_open_url_caches_filesystem_per_thread(netcdf_local_paths_sequential_1d):
+    all_urls = netcdf_local_paths_sequential_1d[0]
+    open_url.cache_clear()
+    of1, of2 = (open_url(url) for url in all_urls[:2])
+    assert of1.fs is of2.fs
+    assert of1.path != of2.path
+    assert openers._cached_fs.cache_info().misses == 1
+
+    thread = threading.Thread(target=open_url, args=(all_urls[0],))
+    thread.start()
+    thread.join()
+    assert openers._cached_fs.cache_info().misses == 2
+    open_url.cache_clear()
+    assert openers._cached_fs.cache_info().currsize == 0
+
+
+def test_open_url_kwargs_from_url():
+    pytest.importorskip("s3fs")
+    open_file = open_url("s3://bucket/key?versionId=abc", open_kwargs={"anon": True})
+    assert open_file.fs.version_aware
+    assert open_file.fs.anon
+
+
+def test_open_url_open_file_kwargs(tmp_path):
+    data = b"compressed data"
+    path = str(tmp_path / "foo.gz")
+    with gzip.open(path, mode="wb") as f:
+        f.write(data)
+    with open_url(path, open_kwargs={"compression": "gzip"}) as f:
+        assert f.read() == data
+
+
 @pytest.fixture(params=[False, True], ids=["lazy", "eager"])
 def load(request):
     return request.param
@@ -159,6 +248,351 @@ def test_direct_open_with_xarray(public_url_and_type, load, xarray_open_kwargs):
     is_valid_dataset(ds, in_memory=load)
 
 
+def test_local_path_or_none(netcdf_local_paths_sequential_1d):
+    url = netcdf_local_paths_sequential_1d[0][0]
+    assert _local_path_or_none(open_url(url)) == url
+    assert _local_path_or_none(url) is None
+    assert _local_path_or_none(fsspec.open("memory://foo.nc")) is None
+
+
+@pytest.mark.parametrize(
+    "paths, expected",
+    [
+        (lazy_fixture("netcdf_local_paths_sequential_1d"), FileType.netcdf4),
+        (lazy_fixture("netcdf3_local_paths_sequential_1d"), FileType.netcdf3),
+        (lazy_fixture("zarr_local_paths_sequential_1d"), FileType.zarr),
+    ],
+)
+def test_sniff_file_type(paths, expected):
+    url = paths[0][0]
+    assert _sniff_file_type(url) == expected
+    if expected != FileType.zarr:
+        assert _sniff_file_type(open_url(url)) == expected
+        with open(url, mode="rb") as f:
+            f.seek(3)
+            assert _sniff_file_type(f) == expected
+            assert f.tell() == 3
+
+
+def test_sniff_file_type_http(netcdf_private_http_paths_sequential_1d, monkeypatch):
+    all_urls, _, _, _, extra_kwargs, _ = netcdf_private_http_paths_sequential_1d
+    secrets = extra_kwargs.get("query_string_secrets")
+    url = _add_query_string_secrets(all_urls[0], secrets) if secrets else all_urls[0]
+    auth = extra_kwargs.get("fsspec_open_kwargs", {})
+
+    def no_open(*args, **kwargs):
+        raise AssertionError("sniffing should use a single ranged read, not `fs.open`")
+
+    monkeypatch.setattr(HTTPFileSystem, "open", no_open)
+    assert _sniff_file_type(url, storage_options=auth) == FileType.netcdf4
+    if auth:
+        assert _sniff_file_type(url) == FileType.unknown  # missing credentials
+    open_file = fsspec.core.OpenFile(HTTPFileSystem(**auth), url)
+    assert _sniff_file_type(open_file) == FileType.netcdf4
+
+
+def test_sniff_file_type_unknown(tmp_path):
+    path = tmp_path / "foo.txt"
+    path.write_text("not a netcdf file")
+    assert _sniff_file_type(str(path)) == FileType.unknown
+    assert _sniff_file_type(str(tmp_path / "missing")) == FileType.unknown
+
+
+def test_open_with_xarray_cdf5(tmp_path):
+    pytest.importorskip("netCDF4")
+    path = str(tmp_path / "cdf5.nc")
+    expected = xr.Dataset({"foo": ("x", np.arange(3))})
+    expected.to_netcdf(path, engine="netcdf4", format="NETCDF3_64BIT_DATA")
+    assert _sniff_file_type(path) == FileType.unknown
+    ds = open_with_xarray(path, load=True)
+    xr.testing.assert_identical(ds, expected)
+
+
+@pytest.mark.parametrize(
+    "xr_kwargs, expected",
+    [
+        ({}, {"engine": "zarr", "chunks": {}, "consolidated": True}),
+        ({"chunks": None}, {"engine": "zarr", "chunks": None, "consolidated": True}),
+        ({"consolidated": False}, {"engine": "zarr", "chunks": {}, "consolidated": False}),
+    ],
+)
+def test_set_engine_zarr_defaults(xr_kwargs, expected):
+    assert _set_engine(FileType.zarr, xr_kwargs) == expected
+
+
+def test_set_engine_zarr_defaults_not_shared():
+    kw1, kw2 = (_set_engine(FileType.zarr, {}) for _ in range(2))
+    assert kw1["chunks"] is not kw2["chunks"]
+    kw1["chunks"]["time"] = 1
+    assert _set_engine(FileType.zarr, {})["chunks"] == {}
+
+
+def test_open_with_xarray_unconsolidated_zarr(daily_xarray_dataset, tmp_path):
+    path = str(tmp_path / "unconsolidated.zarr")
+    daily_xarray_dataset.to_zarr(path, consolidated=False)
+    with pytest.raises((KeyError, FileNotFoundError)):
+        xr.open_dataset(path, engine="zarr", consolidated=True)
+    with warnings.catch_warnings():
+        # retried with ``consolidated=False``, so xarray doesn't warn about the missing metadata
+        warnings.simplefilter("error", RuntimeWarning)
+        ds = open_with_xarray(path, file_type=FileType.zarr)
+    xr.testing.assert_identical(ds.load(), daily_xarray_dataset)
+    # an explicit ``consolidated=True`` is not retried
+    with pytest.raises((KeyError, FileNotFoundError)):
+        open_with_xarray(path, file_type=FileType.zarr, xarray_open_kwargs={"consolidated": True})
+
+
+def test_open_dataset_retries_only_consolidated_metadata(monkeypatch):
+    calls = []
+
+    def open_dataset(url_or_file_obj, **kw):
+        calls.append(kw)
+        raise FileNotFoundError(url_or_file_obj)
+
+    monkeypatch.setattr(xr, "open_dataset", open_dataset)
+    kw = {"engine": "zarr", "consolidated": True}
+    with pytest.raises(FileNotFoundError):
+        openers._open_dataset("missing.zarr", kw, {"consolidated"})
+    assert calls == [kw]
+
+
+@pytest.mark.parametrize("xr_kwargs", [{"decode_times": False}, {"backend_kwargs": {"foo": 1}}])
+def test_set_engine_cache(xr_kwargs):
+    kw1 = _set_engine(FileType.netcdf4, xr_kwargs)
+    kw1["mutated"] = True
+    kw2 = _set_engine(FileType.netcdf4, xr_kwargs)
+    assert kw2 == {"engine": "h5netcdf", **xr_kwargs}
+    assert "engine" not in xr_kwargs
+
+
+def test_open_with_xarray_tensorstore(zarr_local_paths_sequential_1d, load, xarray_open_kwargs):
+    pytest.importorskip("tensorstore")
+    url = zarr_local_paths_sequential_1d[0][0]
+    xr_kwargs, validate_fn = xarray_open_kwargs
+    ds = open_with_xarray(
+        url,
+        file_type=FileType.zarr,
+        load=load,
+        xarray_open_kwargs=xr_kwargs,
+        zarr_backend="tensorstore",
+    )
+    validate_fn(ds)
+    is_valid_dataset(ds, in_memory=load)
+    expected = open_with_xarray(url, file_type=FileType.zarr, xarray_open_kwargs=xr_kwargs)
+    if not load:
+        assert ds.foo.chunks == expected.foo.chunks is not None
+    xr.testing.assert_identical(ds.load(), expected.load())
+
+
+@pytest.mark.parametrize("xr_kwargs", [{"decode_cf": False}, {"chunks": None}, {"chunks": 2}])
+def test_open_with_xarray_tensorstore_kwargs(zarr_local_paths_sequential_1d, xr_kwargs):
+    pytest.importorskip("tensorstore")
+    url = zarr_local_paths_sequential_1d[0][0]
+    ds = open_with_xarray(
+        url, file_type=FileType.zarr, xarray_open_kwargs=xr_kwargs, zarr_backend="tensorstore"
+    )
+    expected = open_with_xarray(url, file_type=FileType.zarr, xarray_open_kwargs=xr_kwargs)
+    assert ds.foo.chunks == expected.foo.chunks
+    xr.testing.assert_identical(ds.load(), expected.load())
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("/tmp/foo.zarr", {"driver": "file", "path": "/tmp/foo.zarr/"}),
+        ("s3://bucket/foo.zarr", {"driver": "s3", "bucket": "bucket", "path": "foo.zarr/"}),
+        ("gs://bucket/foo.zarr/", {"driver": "gcs", "bucket": "bucket", "path": "foo.zarr/"}),
+        (
+            "https://host/a/foo.zarr",
+            {"driver": "http", "base_url": "https://host", "path": "/a/foo.zarr/"},
+        ),
+    ],
+)
+def test_tensorstore_kvstore(url, expected):
+    assert _tensorstore_kvstore(url) == expected
+
+
+@pytest.mark.parametrize(
+    "url, storage_options, expected",
+    [
+        (
+            "s3://bucket/foo.zarr",
+            {"anon": False, "client_kwargs": {"endpoint_url": "http://host", "region_name": "r"}},
+            {"endpoint": "http://host", "aws_region": "r"},
+        ),
+        ("s3://bucket/foo.zarr", {"requester_pays": True}, {"requester_pays": True}),
+        (
+            "https://host/foo.zarr",
+            {"auth": aiohttp.BasicAuth("foo", "bar"), "headers": {"X-Foo": "1"}},
+            {"headers": ["X-Foo: 1", "Authorization: Basic Zm9vOmJhcg=="]},
+        ),
+    ],
+)
+def test_tensorstore_kvstore_storage_options(url, storage_options, expected):
+    assert _tensorstore_kvstore(url, storage_options).items() >= expected.items()
+
+
+@pytest.mark.parametrize(
+    "url, storage_options, match",
+    [
+        ("s3://bucket/foo.zarr", {"anon": True}, r"\['anon'\]"),
+        ("s3://bucket/foo.zarr", {"key": "k", "secret": "s"}, r"\['key', 'secret'\]"),
+        ("gs://bucket/foo.zarr", {"token": "anon"}, r"\['token'\]"),
+        ("/tmp/foo.zarr", {"client_kwargs": {"foo": 1}}, r"\['client_kwargs.foo'\]"),
+        ("https://host/foo.zarr?token=abc", None, "query strings"),
+        ("ftp://host/foo.zarr", None, "not supported"),
+    ],
+)
+def test_tensorstore_kvstore_unsupported(url, storage_options, match):
+    with pytest.raises(ValueError, match=match):
+        _tensorstore_kvstore(url, storage_options)
+
+
+@pytest.mark.parametrize("as_store", [False, True], ids=["url", "fsstore"])
+def test_open_with_xarray_tensorstore_http(zarr_public_http_paths_sequential_1d, as_store):
+    pytest.importorskip("tensorstore")
+    url = zarr_public_http_paths_sequential_1d[0][0]
+    source = zarr.storage.FSStore(url) if as_store else url
+    ds = open_with_xarray(source, file_type=FileType.zarr, zarr_backend="tensorstore")
+    expected = open_with_xarray(url, file_type=FileType.zarr)
+    xr.testing.assert_identical(ds.load(), expected.load())
+    with pytest.raises(ValueError, match="can't be passed to tensorstore"):
+        open_with_xarray(
+            url,
+            file_type=FileType.zarr,
+            xarray_open_kwargs={"storage_options": {"unsupported": True}},
+            zarr_backend="tensorstore",
+        )
+
+
+def test_open_with_xarray_tensorstore_unconsolidated(daily_xarray_dataset, tmp_path):
+    pytest.importorskip("tensorstore")
+    path = str(tmp_path / "unconsolidated.zarr")
+    daily_xarray_dataset.to_zarr(path, consolidated=False)
+    for xr_kwargs in ({}, {"consolidated": False}):
+        ds = open_with_xarray(
+            path, file_type=FileType.zarr, xarray_open_kwargs=xr_kwargs, zarr_backend="tensorstore"
+        )
+        xr.testing.assert_identical(ds.load(), daily_xarray_dataset)
+    with pytest.raises(KeyError):
+        open_with_xarray(
+            path,
+            file_type=FileType.zarr,
+            xarray_open_kwargs={"consolidated": True},
+            zarr_backend="tensorstore",
+        )
+
+
+@pytest.mark.parametrize("in_backend_kwargs", [False, True])
+def test_open_with_xarray_tensorstore_storage_options(
+    zarr_local_paths_sequential_1d, monkeypatch, in_backend_kwargs
+):
+    pytest.importorskip("tensorstore")
+    url = zarr_local_paths_sequential_1d[0][0]
+    storage_options = {"auto_mkdir": False}
+    xr_kwargs = (
+        {"backend_kwargs": {"storage_options": storage_options}}
+        if in_backend_kwargs
+        else {"storage_options": storage_options}
+    )
+    calls = []
+    original_get_mapper = fsspec.get_mapper
+
+    def get_mapper(url, **kwargs):
+        calls.append(kwargs)
+        return original_get_mapper(url, **kwargs)
+
+    monkeypatch.setattr(openers.fsspec, "get_mapper", get_mapper)
+    open_with_xarray(
+        url, file_type=FileType.zarr, xarray_open_kwargs=xr_kwargs, zarr_backend="tensorstore"
+    )
+    assert calls == [storage_options]
+
+
+def test_tensorstore_array_handles_are_shared(zarr_local_paths_sequential_1d):
+    pytest.importorskip("tensorstore")
+    url = zarr_local_paths_sequential_1d[0][0]
+    ds = open_with_xarray(
+        url,
+        file_type=FileType.zarr,
+        xarray_open_kwargs={"chunks": None},
+        zarr_backend="tensorstore",
+    )
+    array = ds.foo.variable._data.array
+    assert isinstance(array, openers._TensorStoreArray)
+    assert loads(dumps(array)).array is array.array
+
+
+def test_array_caching_group(zarr_local_paths_sequential_1d):
+    group = zarr.open_group(zarr_local_paths_sequential_1d[0][0], mode="r")
+    cached = loads(dumps(_ArrayCachingGroup(group)))
+    assert cached["foo"] is cached["foo"]
+    assert "foo" in cached and sorted(cached) == sorted(group)
+    assert cached.attrs == group.attrs
+
+
+def test_share_zarr_array_handles(zarr_local_paths_sequential_1d, monkeypatch):
+    monkeypatch.setattr(openers, "_ZARR_WRAPPER_REOPENS_ARRAY", True)
+    url = zarr_local_paths_sequential_1d[0][0]
+    ds = open_with_xarray(url, file_type=FileType.zarr)
+    store = ds._close.__self__
+    assert isinstance(store.zarr_group, _ArrayCachingGroup)
+
+    lookups = []
+    group_getitem = zarr.Group.__getitem__
+
+    def counting_getitem(self, item):
+        lookups.append(item)
+        return group_getitem(self, item)
+
+    monkeypatch.setattr(zarr.Group, "__getitem__", counting_getitem)
+    # what older xarray's ``ZarrArrayWrapper.get_array`` does on every chunk read
+    arrays = [store.zarr_group["foo"] for _ in range(3)]
+    assert all(a is arrays[0] for a in arrays)
+    assert lookups == ["foo"]
+    xr.testing.assert_identical(ds.load(), xr.open_dataset(url, engine="zarr").load())
+
+
+def test_set_engine_warns_once(monkeypatch):
+    monkeypatch.setattr(openers, "_warned", set())
+    xr_kwargs = {"engine": "h5netcdf", "backend_kwargs": {}}  # unhashable, so not lru-cached
+    with pytest.warns(UserWarning, match="same value you have passed"):
+        _set_engine(FileType.netcdf4, xr_kwargs)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        _set_engine(FileType.netcdf4, xr_kwargs)
+    with pytest.raises(ValueError, match="different from the value"):
+        _set_engine(FileType.netcdf4, {"engine": "scipy", "backend_kwargs": {}})
+
+
+@pytest.mark.parametrize(
+    "kerchunk_version, has_chunk_iter, expected",
+    [
+        ((0, 1, 2), True, True),
+        ((0, 1, 2), False, False),
+        ((0, 1, 1), True, False),
+    ],
+)
+def test_check_hdf5_chunk_iter(monkeypatch, kerchunk_version, has_chunk_iter, expected):
+    h5py = pytest.importorskip("h5py")
+    attrs = {"chunk_iter": lambda self, cb: None} if has_chunk_iter else {}
+    monkeypatch.setattr(h5py.h5d, "DatasetID", type("DatasetID", (), attrs))
+    monkeypatch.setattr(openers, "_kerchunk_version", lambda: kerchunk_version)
+    openers._check_hdf5_chunk_iter.cache_clear()
+    try:
+        with warnings.catch_warnings(record=True) as record:
+            warnings.simplefilter("always")
+            for _ in range(3):
+                assert openers._check_hdf5_chunk_iter() == expected
+        assert len(record) == (0 if expected else 1)
+    finally:
+        openers._check_hdf5_chunk_iter.cache_clear()
+
+
+def test_kerchunk_version():
+    assert openers._kerchunk_version() >= (0, 0, 7)
+
+
 def is_valid_inline_threshold():
     def _is_valid_inline_threshold(references):
 
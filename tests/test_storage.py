@@ -1,11 +1,20 @@
+import gzip
 import hashlib
+import io
 import os
+import sys
 
+import fsspec
 import pytest
 from fsspec.implementations.http import HTTPFileSystem
 from fsspec.implementations.local import LocalFileSystem
 
-from pangeo_forge_recipes.storage import CacheFSSpecTarget, FSSpecTarget
+from pangeo_forge_recipes.storage import (
+    CacheFSSpecTarget,
+    FSSpecTarget,
+    _copy_btw_filesystems_overlapped,
+    _copy_with_sendfile,
+)
 
 POSIX_MAX_FNAME_LENGTH = 255
 
@@ -95,3 +104,41 @@ def test_suffix(tmp_path):
     assert str((FSSpecTarget(LocalFileSystem(), tmp_path) / "test").root_path) == str(
         tmp_path / "test"
     )
+
+
+@pytest.mark.parametrize("from_file", [True, False], ids=["sendfile", "threaded"])
+@pytest.mark.parametrize("block_size", [1, 7, 1 << 20])
+def test_copy_btw_filesystems_overlapped(tmp_path, block_size, from_file):
+    data = os.urandom(1000)
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.write_bytes(data)
+    source = open(src, mode="rb") if from_file else io.BytesIO(data)
+    _copy_btw_filesystems_overlapped(
+        source, open(dst, mode="wb"), BLOCK_SIZE=block_size, max_pending_blocks=2
+    )
+    assert dst.read_bytes() == data
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="sendfile to files is Linux-only")
+def test_copy_with_sendfile(tmp_path):
+    data = os.urandom(1000)
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.write_bytes(data)
+    with open(dst, mode="wb") as target:
+        assert not _copy_with_sendfile(io.BytesIO(data), target)
+        with open(src, mode="rb") as source:
+            source.seek(10)
+            assert _copy_with_sendfile(source, target)
+    assert dst.read_bytes() == data[10:]
+
+
+def test_copy_btw_filesystems_overlapped_gzip(tmp_path):
+    data = os.urandom(1000)
+    src, dst = tmp_path / "src.gz", tmp_path / "dst"
+    with gzip.open(src, mode="wb") as f:
+        f.write(data)
+    with open(dst, mode="wb") as target:
+        assert not _copy_with_sendfile(gzip.open(src, mode="rb"), target)
+    source = fsspec.open(str(src), mode="rb", compression="gzip")
+    _copy_btw_filesystems_overlapped(source, open(dst, mode="wb"))
+    assert dst.read_bytes() == data